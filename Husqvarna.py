@@ -6,31 +6,57 @@ https://developer.husqvarnagroup.cloud/applications
 
 """
 
+DEBUG = True #set by the plugin when Domoticz debugging is off; guards the formatting of the chatty messages
+
 try:
     import Domoticz
     def log(msg=""):
-        if len('{}'.format(msg)) <= 5000:
-            Domoticz.Debug(">> {}".format(msg))
+        if not DEBUG:
+            return
+        msg = msg if isinstance(msg, str) else '{}'.format(msg) #format only once
+        if len(msg) <= 5000:
+            Domoticz.Debug(">> " + msg)
         else:
             Domoticz.Debug(">> (in several blocks)")
-            string = [msg[i:i+5000] for i in range(0, len('{}'.format(msg)), 5000)]
-            for k in string:
-                Domoticz.Debug(">> {}".format(k))
+            for i in range(0, len(msg), 5000):
+                Domoticz.Debug(">> " + msg[i:i+5000])
 except:
     def log(msg=""):
-        print(msg)
+        if DEBUG:
+            print(msg)
+
+try:
+    from orjson import loads as json_loads   #faster parsing when available
+except ImportError:
+    from json import loads as json_loads
 
 import requests
+from requests.adapters import HTTPAdapter
+import sys
 import time
+import random
+import threading
+import hashlib
+import json
+import os
 from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+from types import MappingProxyType
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
 requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
 
 URL_TOKEN_REQUEST = 'https://api.authentication.husqvarnagroup.dev/v1/oauth2/token'
 URL_BASE_API = 'https://api.amc.husqvarna.dev/v1/'
-URL_GET_MOWERS = '{}{}'.format(URL_BASE_API, 'mowers')
+URL_GET_MOWERS = f'{URL_BASE_API}mowers'
 API_CALL_DELAY = 2
 API_TIMEOUT = 10 #seconds
+API_CONNECT_TIMEOUT = 5 #seconds
+MOWERS_INFO_CACHE_TTL = 25 #seconds
+TOKEN_REFRESH_AHEAD = 300 #seconds before the access token expires
+TOKEN_REFRESH_RETRY = 60 #seconds before trying again when the renewal in background failed
+API_MAX_RETRY_AFTER = 30 #seconds waited in total per call when the API asks to retry later (keeps one call well under the 70 seconds onStop waits; a task can do more than one call)
+API_MAX_BACKOFF = 30 #seconds
+API_LIMIT_DEFAULT_WAIT = 60 #seconds without calls after reaching the API limits (when the API does not tell how long)
 
 ACTION_PARKNEXTSCHEDULE = 'ParkUntilNextSchedule'
 ACTION_PARKFURTHERNOTICE = 'ParkUntilFurtherNotice'
@@ -38,140 +64,154 @@ ACTION_PAUSE = 'Pause'
 ACTION_RESUMESCHEDULE = 'ResumeSchedule'
 ACTION_START = 'Start'
 
+_VALID_ACTIONS = frozenset([ACTION_PARKNEXTSCHEDULE, ACTION_PARKFURTHERNOTICE, ACTION_PAUSE, ACTION_RESUMESCHEDULE, ACTION_START])
+
+#Fixed payloads (the Start action has a variable duration)
+_ACTION_PAYLOADS = { action: { 'data': {'type': action} } for action in [ACTION_PARKNEXTSCHEDULE, ACTION_PARKFURTHERNOTICE, ACTION_PAUSE, ACTION_RESUMESCHEDULE] }
+_HEADLIGHT_PAYLOADS = { light: { 'data': {'type': 'settings', 'attributes': {'headlight': {'mode': mode} } } } for light, mode in [(True, 'ALWAYS_ON'), (False, 'ALWAYS_OFF')] }
+
+#Headers sent per request (the session headers are never changed)
+_JSON_API_HEADERS = { 'Content-Type': 'application/vnd.api+json' }
+_TOKEN_REQUEST_HEADERS = { 'Content-Type': 'application/x-www-form-urlencoded' }
+
 STATE_OFF = 'OFF'
+_ERROR_STATES = frozenset(['ERROR', 'FATAL_ERROR', 'ERROR_AT_POWER_UP'])
 
 POST = 0
 GET = 1
 
-ErrorCodes = {
-    0:    'Unexpected error',
-    1:    'Outside working area',
-    2:    'No loop signal',
-    3:    'Wrong loop signal',
-    4:    'Loop sensor problem, front',
-    5:    'Loop sensor problem, rear',
-    6:    'Loop sensor problem, left',
-    7:    'Loop sensor problem, right',
-    8:    'Wrong PIN code',
-    9:    'Trapped',
-    10:   'Upside down',
-    11:   'Low battery',
-    12:   'Empty battery',
-    13:   'No drive',
-    14:   'Mower lifted',
-    15:   'Lifted',
-    16:   'Stuck in charging station',
-    17:   'Charging station blocked',
-    18:   'Collision sensor problem, rear',
-    19:   'Collision sensor problem, front',
-    20:   'Wheel motor blocked, right',
-    21:   'Wheel motor blocked, left',
-    22:   'Wheel drive problem, right',
-    23:   'Wheel drive problem, left',
-    24:   'Cutting system blocked',
-    25:   'Cutting system blocked',
-    26:   'Invalid sub-device combination',
-    27:   'Settings restored',
-    28:   'Memory circuit problem',
-    29:   'Slope too steep',
-    30:   'Charging system problem',
-    31:   'STOP button problem',
-    32:   'Tilt sensor problem',
-    33:   'Mower tilted',
-    34:   'Cutting stopped - slope too steep',
-    35:   'Wheel motor overloaded, right',
-    36:   'Wheel motor overloaded, left',
-    37:   'Charging current too high',
-    38:   'Electronic problem',
-    39:   'Cutting motor problem',
-    40:   'Limited cutting height range',
-    41:   'Unexpected cutting height adj',
-    42:   'Limited cutting height range',
-    43:   'Cutting height problem, drive',
-    44:   'Cutting height problem, curr',
-    45:   'Cutting height problem, dir',
-    46:   'Cutting height blocked',
-    47:   'Cutting height problem',
-    48:   'No response from charger',
-    49:   'Ultrasonic problem',
-    50:   'Guide 1 not found',
-    51:   'Guide 2 not found',
-    52:   'Guide 3 not found',
-    53:   'GPS navigation problem',
-    54:   'Weak GPS signal',
-    55:   'Difficult finding home',
-    56:   'Guide calibration accomplished',
-    57:   'Guide calibration failed',
-    58:   'Temporary battery problem',
-    59:   'Temporary battery problem',
-    60:   'Temporary battery problem',
-    61:   'Temporary battery problem',
-    62:   'Temporary battery problem',
-    63:   'Temporary battery problem',
-    64:   'Temporary battery problem',
-    65:   'Temporary battery problem',
-    66:   'Battery problem',
-    67:   'Battery problem',
-    68:   'Temporary battery problem',
-    69:   'Alarm! Mower switched off',
-    70:   'Alarm! Mower stopped',
-    71:   'Alarm! Mower lifted',
-    72:   'Alarm! Mower tilted',
-    73:   'Alarm! Mower in motion',
-    74:   'Alarm! Outside geofence',
-    75:   'Connection changed',
-    76:   'Connection NOT changed',
-    77:   'Com board not available',
-    78:   'Slipped - Mower has Slipped.Situation not solved with moving pattern',
-    79:   'Invalid battery combination - Invalid combination of different battery types.',
-    80:   'Cutting system imbalance  Warning',
-    81:   'Safety function faulty',
-    82:   'Wheel motor blocked, rear right',
-    83:   'Wheel motor blocked, rear left',
-    84:   'Wheel drive problem, rear right',
-    85:   'Wheel drive problem, rear left',
-    86:   'Wheel motor overloaded, rear right',
-    87:   'Wheel motor overloaded, rear left',
-    88:   'Angular sensor problem',
-    89:   'Invalid system configuration',
-    90:   'No power in charging station',
-    91:   'Switch cord problem',
-    92:   'Work area not valid',
-    93:   'No accurate position from satellites',
-    94:   'Reference station communication problem',
-    95:   'Folding sensor activated',
-    96:   'Right brush motor overloaded',
-    97:   'Left brush motor overloaded',
-    98:   'Ultrasonic Sensor 1 defect',
-    99:   'Ultrasonic Sensor 2 defect',
-    100:  'Ultrasonic Sensor 3 defect',
-    101:  'Ultrasonic Sensor 4 defect',
-    102:  'Cutting drive motor 1 defect',
-    103:  'Cutting drive motor 2 defect',
-    104:  'Cutting drive motor 3 defect',
-    105:  'Lift Sensor defect',
-    106:  'Collision sensor defect',
-    107:  'Docking sensor defect',
-    108:  'Folding cutting deck sensor defect',
-    109:  'Loop sensor defect',
-    110:  'Collision sensor error',
-    111:  'No confirmed position',
-    112:  'Cutting system major imbalance',
-    113:  'Complex working area',
-    114:  'Too high discharge current',
-    115:  'Too high internal current',
-    116:  'High charging power loss',
-    117:  'High internal power loss',
-    118:  'Charging system problem',
-    119:  'Zone generator problem',
-    120:  'Internal voltage error',
-    121:  'High internal temerature',
-    122:  'CAN error',
-    123:  'Destination not reachable',
-    124:  'Destination blocked',
-    125:  'Battery needs replacement',
-    126:  'Battery near end of life',
-    127:  'Battery problem',
+_ERROR_MSGS_DENSE = (
+    'Unexpected error',                                                         #0
+    'Outside working area',                                                     #1
+    'No loop signal',                                                           #2
+    'Wrong loop signal',                                                        #3
+    'Loop sensor problem, front',                                               #4
+    'Loop sensor problem, rear',                                                #5
+    'Loop sensor problem, left',                                                #6
+    'Loop sensor problem, right',                                               #7
+    'Wrong PIN code',                                                           #8
+    'Trapped',                                                                  #9
+    'Upside down',                                                              #10
+    'Low battery',                                                              #11
+    'Empty battery',                                                            #12
+    'No drive',                                                                 #13
+    'Mower lifted',                                                             #14
+    'Lifted',                                                                   #15
+    'Stuck in charging station',                                                #16
+    'Charging station blocked',                                                 #17
+    'Collision sensor problem, rear',                                           #18
+    'Collision sensor problem, front',                                          #19
+    'Wheel motor blocked, right',                                               #20
+    'Wheel motor blocked, left',                                                #21
+    'Wheel drive problem, right',                                               #22
+    'Wheel drive problem, left',                                                #23
+    'Cutting system blocked',                                                   #24
+    'Cutting system blocked',                                                   #25
+    'Invalid sub-device combination',                                           #26
+    'Settings restored',                                                        #27
+    'Memory circuit problem',                                                   #28
+    'Slope too steep',                                                          #29
+    'Charging system problem',                                                  #30
+    'STOP button problem',                                                      #31
+    'Tilt sensor problem',                                                      #32
+    'Mower tilted',                                                             #33
+    'Cutting stopped - slope too steep',                                        #34
+    'Wheel motor overloaded, right',                                            #35
+    'Wheel motor overloaded, left',                                             #36
+    'Charging current too high',                                                #37
+    'Electronic problem',                                                       #38
+    'Cutting motor problem',                                                    #39
+    'Limited cutting height range',                                             #40
+    'Unexpected cutting height adj',                                            #41
+    'Limited cutting height range',                                             #42
+    'Cutting height problem, drive',                                            #43
+    'Cutting height problem, curr',                                             #44
+    'Cutting height problem, dir',                                              #45
+    'Cutting height blocked',                                                   #46
+    'Cutting height problem',                                                   #47
+    'No response from charger',                                                 #48
+    'Ultrasonic problem',                                                       #49
+    'Guide 1 not found',                                                        #50
+    'Guide 2 not found',                                                        #51
+    'Guide 3 not found',                                                        #52
+    'GPS navigation problem',                                                   #53
+    'Weak GPS signal',                                                          #54
+    'Difficult finding home',                                                   #55
+    'Guide calibration accomplished',                                           #56
+    'Guide calibration failed',                                                 #57
+    'Temporary battery problem',                                                #58
+    'Temporary battery problem',                                                #59
+    'Temporary battery problem',                                                #60
+    'Temporary battery problem',                                                #61
+    'Temporary battery problem',                                                #62
+    'Temporary battery problem',                                                #63
+    'Temporary battery problem',                                                #64
+    'Temporary battery problem',                                                #65
+    'Battery problem',                                                          #66
+    'Battery problem',                                                          #67
+    'Temporary battery problem',                                                #68
+    'Alarm! Mower switched off',                                                #69
+    'Alarm! Mower stopped',                                                     #70
+    'Alarm! Mower lifted',                                                      #71
+    'Alarm! Mower tilted',                                                      #72
+    'Alarm! Mower in motion',                                                   #73
+    'Alarm! Outside geofence',                                                  #74
+    'Connection changed',                                                       #75
+    'Connection NOT changed',                                                   #76
+    'Com board not available',                                                  #77
+    'Slipped - Mower has Slipped.Situation not solved with moving pattern',     #78
+    'Invalid battery combination - Invalid combination of different battery types.', #79
+    'Cutting system imbalance  Warning',                                        #80
+    'Safety function faulty',                                                   #81
+    'Wheel motor blocked, rear right',                                          #82
+    'Wheel motor blocked, rear left',                                           #83
+    'Wheel drive problem, rear right',                                          #84
+    'Wheel drive problem, rear left',                                           #85
+    'Wheel motor overloaded, rear right',                                       #86
+    'Wheel motor overloaded, rear left',                                        #87
+    'Angular sensor problem',                                                   #88
+    'Invalid system configuration',                                             #89
+    'No power in charging station',                                             #90
+    'Switch cord problem',                                                      #91
+    'Work area not valid',                                                      #92
+    'No accurate position from satellites',                                     #93
+    'Reference station communication problem',                                  #94
+    'Folding sensor activated',                                                 #95
+    'Right brush motor overloaded',                                             #96
+    'Left brush motor overloaded',                                              #97
+    'Ultrasonic Sensor 1 defect',                                               #98
+    'Ultrasonic Sensor 2 defect',                                               #99
+    'Ultrasonic Sensor 3 defect',                                               #100
+    'Ultrasonic Sensor 4 defect',                                               #101
+    'Cutting drive motor 1 defect',                                             #102
+    'Cutting drive motor 2 defect',                                             #103
+    'Cutting drive motor 3 defect',                                             #104
+    'Lift Sensor defect',                                                       #105
+    'Collision sensor defect',                                                  #106
+    'Docking sensor defect',                                                    #107
+    'Folding cutting deck sensor defect',                                       #108
+    'Loop sensor defect',                                                       #109
+    'Collision sensor error',                                                   #110
+    'No confirmed position',                                                    #111
+    'Cutting system major imbalance',                                           #112
+    'Complex working area',                                                     #113
+    'Too high discharge current',                                               #114
+    'Too high internal current',                                                #115
+    'High charging power loss',                                                 #116
+    'High internal power loss',                                                 #117
+    'Charging system problem',                                                  #118
+    'Zone generator problem',                                                   #119
+    'Internal voltage error',                                                   #120
+    'High internal temerature',                                                 #121
+    'CAN error',                                                                #122
+    'Destination not reachable',                                                #123
+    'Destination blocked',                                                      #124
+    'Battery needs replacement',                                                #125
+    'Battery near end of life',                                                 #126
+    'Battery problem',                                                          #127
+)
+
+_ERROR_MSGS_SPARSE = MappingProxyType({
     701:  'Connectivity problem',
     702:  'Connectivity settings restored',
     703:  'Connectivity problem',
@@ -190,37 +230,119 @@ ErrorCodes = {
     716:  'Connectivity problem',
     717:  'SMS could not be sent',
     724:  'Communication circuit board SW must be updated'
-}
+})
+
+def _error_description(code):
+    #Error codes 0..127 are contiguous (tuple index), the connectivity errors (7xx) are sparse
+    if 0 <= code < len(_ERROR_MSGS_DENSE):
+        return _ERROR_MSGS_DENSE[code]
+    return _ERROR_MSGS_SPARSE.get(code)
+
+def _intern(value):
+    #The API can return null for the state/activity (stored as is, only strings can be interned)
+    return sys.intern(value) if isinstance(value, str) else value
+
+class Mower():
+    __slots__ = ('id', 'name', 'url_actions', 'url_settings', 'battery_pct', 'activity', 'state', 'error_state')
+
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+        self.url_actions = f'{URL_GET_MOWERS}/{id}/actions'
+        self.url_settings = f'{URL_GET_MOWERS}/{id}/settings'
+        self.battery_pct = None
+        self.activity = None
+        self.state = None
+        self.error_state = None
+
+    def as_dict(self):
+        return { key: getattr(self, key) for key in self.__slots__ }
+
+    def __repr__(self):
+        return '{}'.format(self.as_dict())
+
+class TokenBucket():
+
+    def __init__(self, capacity, refill_rate):
+        self.capacity = capacity
+        self.refill_rate = refill_rate #tokens per second
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        #Only block when no token is left (thread safe, so calls are also spaced over parallel requests)
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now-self.last)*self.refill_rate)
+            self.last = now
+            if self.tokens < 1:
+                time.sleep((1-self.tokens)/self.refill_rate)
+                self.last = time.monotonic()
+                self.tokens = 1
+            self.tokens -= 1
+
+    def penalize(self):
+        with self.lock:
+            self.tokens = min(self.tokens, -1)
 
 class Husqvarna():
 
-    def __init__(self, client_id, client_secret):
+    def __init__(self, client_id, client_secret, token_file=None):
         self.mowers = []
+        self.mowers_by_name = {}
         self.client_id = client_id
         self.client_secret = client_secret
         self.access_token = None
-        self.access_token_expiration = datetime(2000,1,1)
+        self.access_token_expiration = datetime(2000,1,1)   #for logging and the token file only
+        self.access_token_deadline = 0.0                    #time.monotonic() value, not affected by changes of the clock
+        self.token_lock = threading.RLock()
+        self.token_refresh_timer = None
+        self.closed = False
+        self.auth_headers = {}
+        self.auth_json_api_headers = _JSON_API_HEADERS
+        self.token_file = token_file
         self.timestamp_last_update_mower_list = datetime(2000,1,1)
+        self.timestamp_last_update_mower_info = datetime(2000,1,1)  #for logging only
+        self.mowers_info_deadline = 0.0                             #time.monotonic() value until which the mower information is used from the cache
         self.s = requests.Session()
         self.s.verify = False
+        #Keep a warm connection to the authentication and the API host
+        #No retries by urllib3: all retries are done in _http_request, which bounds the time of one call (not of a task, which can also renew the access token)
+        self.s.mount('https://', HTTPAdapter(pool_connections=2, pool_maxsize=2))
         self.error = None
         self.api_limit_reached = False
+        self.api_limit_deadline = 0.0 #time.monotonic() value
+        self.bucket = TokenBucket(capacity=1, refill_rate=1/API_CALL_DELAY)
+        self._load_cached_token()
         
     def __bool__(self):
         log('Return value on creation of Husqvarna object')
-        return self._get_access_token()
+        return self._check_access_token_and_renew()
                 
     def get_mowers(self):
         if self._check_access_token_and_renew():
             status = self._get_mowers()
             if status:
+                #The list of mowers contains already the status of the mowers (no need to get it again)
                 self.timestamp_last_update_mower_list = datetime.now()
+                self.timestamp_last_update_mower_info = self.timestamp_last_update_mower_list
+                self.mowers_info_deadline = time.monotonic() + MOWERS_INFO_CACHE_TTL
             return status
         return False
 
-    def get_mowers_info(self):
+    def get_mowers_info(self, force=False):
+        #Avoid calling the API again when the information is still recent
+        if not force and time.monotonic() < self.mowers_info_deadline:
+            if DEBUG:
+                log('Use cached mower information of {}'.format(self.timestamp_last_update_mower_info))
+            return True
         if self._check_access_token_and_renew():
-            return self._get_mower_detailed_info()
+            status = self._get_mower_detailed_info()
+            if status:
+                self.timestamp_last_update_mower_info = datetime.now()
+                self.mowers_info_deadline = time.monotonic() + MOWERS_INFO_CACHE_TTL
+            return status
         return False
 
     def action_ParkUntilNextSchedule(self, mower_name):
@@ -242,77 +364,161 @@ class Husqvarna():
         if not self._check_access_token_and_renew():
             return False
 
-        mower_id = self._find_id_from_name(mower_name)
-        if mower_id:
-            if light:
-                json = { 'data': {'type': 'settings', 'attributes': {'headlight': {'mode': 'ALWAYS_ON'} } } } 
-            else:
-                json = { 'data': {'type': 'settings', 'attributes': {'headlight': {'mode': 'ALWAYS_OFF'} } } } 
-            self.s.headers.update( { 'Content-Type': 'application/vnd.api+json' } )
-            action = self._http_with_retry(POST, '{}/{}/settings'.format(URL_GET_MOWERS, mower_id), json, mower_name=mower_name)
+        mower = self.mowers_by_name.get(mower_name)
+        if mower:
+            json = _HEADLIGHT_PAYLOADS[bool(light)]
+            action = self._http_with_retry(POST, mower.url_settings, json, mower_name=mower_name)
             if action:
+                self._invalidate_mowers_info()
                 return True
         return False
 
     def are_all_mowers_off(self):
-        status = True
-        for mower in self.mowers:
-            if 'state' in mower and mower['state'] != STATE_OFF:
-                status = False
-                break
-        return status
+        return all(mower.state is None or mower.state == STATE_OFF for mower in self.mowers)
 
     def get_timestamp_last_update_mower_list(self):
         return self.timestamp_last_update_mower_list
         
     def is_mower_off(self, name):
-        for mower in self.mowers:
-            if name == mower['name']:
-                return mower['state'] == STATE_OFF
-        return None
+        mower = self.mowers_by_name.get(name)
+        return mower.state == STATE_OFF if mower else None
         
     def are_api_limits_reached(self):
         return self.api_limit_reached    
         
     def close(self):
+        #Taking the lock waits for a renewal in progress, which would schedule a new timer
+        with self.token_lock:
+            self.closed = True
+            timer = self.token_refresh_timer
+            if timer:
+                timer.cancel()
+        #Domoticz aborts when threads of the plugin are still running after onStop
+        if timer and timer is not threading.current_thread():
+            timer.join()
         self.s.close()
 
     def get_http_error(self):
         return self.error
 
     def _get_access_token(self):
-        self.s.headers.clear()
-        self.s.headers.update({'Content-Type': 'application/x-www-form-urlencoded'})
+        status, self.error = self._request_access_token()
+        return status
+
+    def _request_access_token(self):
         data = { 'grant_type': 'client_credentials',
                  'client_id' : self.client_id,
                  'client_secret': self.client_secret,
                  'token_endpoint': URL_TOKEN_REQUEST
                }
-        self.access_token = self._http_with_retry(POST, URL_TOKEN_REQUEST, post_data=data)
-
-        # Return if authenticated
-        status = False
-        if self.access_token:
-            self.error = None
-            self.access_token_expiration = datetime.now() + timedelta(seconds=self.access_token['expires_in']) - timedelta(seconds=600)
-            self.s.headers.update( {
-                'x-api-key': self.client_id,
-                'Authorization': '{} {}'.format(self.access_token['token_type'], self.access_token['access_token']),
-                'Authorization-Provider': self.access_token['provider'],
-                'accept': 'application/vnd.api+json'
-            } )
-            status = True
-            log('New access token generated!!! Expiration: {} - Type: {} - Token: ...{}'.format(datetime.now() + timedelta(seconds=self.access_token['expires_in']), self.access_token['token_type'], self.access_token['access_token'][-20:]))
-        else:
-            self.error = 'Bad or unauthorized authentication request (url: {}).'.format(URL_TOKEN_REQUEST)
-
-        return status
+        with self.token_lock:
+            access_token, error = self._http_request(POST, URL_TOKEN_REQUEST, post_data=data, headers=_TOKEN_REQUEST_HEADERS)
+
+            # Return if authenticated
+            if not access_token:
+                return False, 'Bad or unauthorized authentication request (url: {}).'.format(URL_TOKEN_REQUEST)
+
+            self._set_access_token(access_token, datetime.now() + timedelta(seconds=access_token['expires_in']) - timedelta(seconds=600))
+            if DEBUG:
+                log('New access token generated!!! Expiration: {} - Type: {} - Token: ...{}'.format(datetime.now() + timedelta(seconds=self.access_token['expires_in']), self.access_token['token_type'], self.access_token['access_token'][-20:]))
+            self._save_cached_token()
+        return True, None
+
+    def _set_access_token(self, access_token, expiration):
+        #Build the request headers once per access token (replacing the references is safe while other calls are ongoing)
+        #Done first: an incomplete access token (KeyError/TypeError) leaves the current access token untouched
+        auth_headers = {
+            'x-api-key': self.client_id,
+            'Authorization': '{} {}'.format(access_token['token_type'], access_token['access_token']),
+            'Authorization-Provider': access_token['provider'],
+            'accept': 'application/vnd.api+json'
+        }
+        with self.token_lock:
+            self.access_token = access_token
+            self.access_token_expiration = expiration
+            self.access_token_deadline = time.monotonic() + (expiration - datetime.now()).total_seconds()
+            self.auth_json_api_headers = { **auth_headers, **_JSON_API_HEADERS }
+            self.auth_headers = auth_headers
+            self._schedule_token_refresh()
+
+    def _invalidate_access_token(self):
+        #Access token refused by the API: request a new one on the next call
+        with self.token_lock:
+            self.access_token_expiration = datetime(2000,1,1)
+            self.access_token_deadline = 0.0
+            if self.token_refresh_timer:
+                self.token_refresh_timer.cancel()
+            if self.token_file:
+                try:
+                    os.remove(self.token_file)
+                except OSError:
+                    pass
+
+    def _get_token_file_key(self):
+        #The token file only belongs to the client_id it was created for (without storing the client_id itself)
+        return hashlib.sha256(self.client_id.encode()).hexdigest()[:16]
+
+    def _load_cached_token(self):
+        #Reuse the access token of a previous run (eg restart of Domoticz) when it is still valid
+        if not self.token_file:
+            return
+        try:
+            with open(self.token_file) as infile:
+                cached_token = json.load(infile)
+            if cached_token['client'] != self._get_token_file_key():
+                return
+            expiration = datetime.fromtimestamp(cached_token['expiration'])
+            if expiration > datetime.now():
+                self._set_access_token(cached_token['access_token'], expiration)
+                log('Access token loaded from {}. Expiration: {}'.format(self.token_file, expiration))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as err:
+            #No usable cached access token: a new one is requested on the first call
+            log('Unable to load access token from {}: {}'.format(self.token_file, err))
+
+    def _save_cached_token(self):
+        if not self.token_file:
+            return
+        try:
+            with open(os.open(self.token_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as outfile:
+                os.chmod(self.token_file, 0o600) #the mode of os.open is only used when the file is created
+                json.dump({'client': self._get_token_file_key(), 'access_token': self.access_token, 'expiration': self.access_token_expiration.timestamp()}, outfile)
+        except OSError as err:
+            log('Unable to save access token to {}: {}'.format(self.token_file, err))
+
+    def _schedule_token_refresh(self, delay=None):
+        #Renew the access token in the background before it expires, so API calls do not wait for it
+        if self.token_refresh_timer:
+            self.token_refresh_timer.cancel()
+        if delay is None:
+            delay = self.access_token_deadline - time.monotonic() - TOKEN_REFRESH_AHEAD
+        if delay > 0 and not self.closed:
+            self.token_refresh_timer = threading.Timer(delay, self._refresh_access_token)
+            self.token_refresh_timer.name = 'HusqvarnaTokenRefresh'
+            self.token_refresh_timer.daemon = True
+            self.token_refresh_timer.start()
+
+    def _refresh_access_token(self):
+        with self.token_lock:
+            if self.closed:
+                return
+            status, error = self._request_access_token()
+            if not status:
+                log('Renewal of access token in background failed: {}'.format(error))
+                #Try again shortly, as long as the current access token is still valid
+                if self.access_token_deadline - time.monotonic() > TOKEN_REFRESH_RETRY:
+                    self._schedule_token_refresh(TOKEN_REFRESH_RETRY)
 
     def _check_access_token_and_renew(self):
-        if datetime.now() > self.access_token_expiration:
-            log('Create new access token!!!')
-            return self._get_access_token()
-        log('Use existing access token!!! Expiration: {} - Type: {} - Token: ...{}'.format(self.access_token_expiration, self.access_token['token_type'], self.access_token['access_token'][-20:]))
+        if time.monotonic() >= self.access_token_deadline:
+            #Only wait for a new access token when the current one is really expired
+            with self.token_lock:
+                if time.monotonic() >= self.access_token_deadline:
+                    log('Create new access token!!!')
+                    return self._get_access_token()
+        if DEBUG:
+            log('Use existing access token!!! Expiration: {} - Type: {} - Token: ...{}'.format(self.access_token_expiration, self.access_token['token_type'], self.access_token['access_token'][-20:]))
         return True
 
     def _get_mowers(self):
@@ -321,115 +527,196 @@ class Husqvarna():
         if mowers:
             self.mowers = []
             for mower in mowers['data']:
-                self.mowers.append({'id': mower['id'], 'name': mower['attributes']['system']['name']})
-            return True
+                self.mowers.append(Mower(mower['id'], mower['attributes']['system']['name']))
+            self.mowers_by_name = { mower.name: mower for mower in self.mowers }
+            return self._update_mowers_info(mowers)
         return False
 
     def _get_mower_detailed_info(self):
-        status = True
-        for index, mower in enumerate(self.mowers):
-            mower_info = self._http_with_retry(GET, '{}/{}'.format(URL_GET_MOWERS, mower['id']), mower_name=self.mowers[index]['name'])
-            if mower_info:
-                self.mowers[index]['battery_pct'] = mower_info['data']['attributes']['battery']['batteryPercent']
-                self.mowers[index]['activity'] = mower_info['data']['attributes']['mower']['activity']
-                self.mowers[index]['state'] = mower_info['data']['attributes']['mower']['state']
-                try:
-                    self.mowers[index]['error_state'] = ErrorCodes[mower_info['data']['attributes']['mower']['errorCode']] if 'ERROR' in self.mowers[index]['state'] else None
-                except:
-                    self.mowers[index]['error_state'] = None
-            else:
-                status = False
-                break
-        return status
+        #The list of mowers contains already all attributes of every mower (one call for all mowers)
+        mowers_info = self._http_with_retry(GET, URL_GET_MOWERS)
+        if not mowers_info:
+            return False
+        return self._update_mowers_info(mowers_info)
+
+    def _update_mowers_info(self, mowers_info):
+        attributes = { mower_info['id']: mower_info['attributes'] for mower_info in mowers_info['data'] }
+        for mower in self.mowers:
+            if mower.id not in attributes:
+                self.error = 'Mower {} not found in the list of mowers (url: {}).'.format(mower.name, URL_GET_MOWERS)
+                return False
+            mower_attributes = attributes[mower.id]
+            mower.battery_pct = mower_attributes['battery']['batteryPercent']
+            #Interned, so the compares with the state/activity constants are resolved on identity
+            mower.activity = _intern(mower_attributes['mower']['activity'])
+            mower.state = _intern(mower_attributes['mower']['state'])
+            try:
+                mower.error_state = _error_description(mower_attributes['mower']['errorCode']) if mower.state in _ERROR_STATES else None
+            except:
+                mower.error_state = None
+        return True
             
     def _send_action_to_mower(self, mower_name, action, duration=60):
-        if action not in [ACTION_PARKNEXTSCHEDULE, ACTION_PARKFURTHERNOTICE, ACTION_PAUSE, ACTION_RESUMESCHEDULE, ACTION_START]:
+        if action not in _VALID_ACTIONS:
             return False
 
         if not self._check_access_token_and_renew():
             return False
 
-        mower_id = self._find_id_from_name(mower_name)
-        if mower_id:
+        mower = self.mowers_by_name.get(mower_name)
+        if mower:
             if action == ACTION_START:
                 json = { 'data': {'type': action, 'attributes': {'duration': duration} } } 
             else:
-                json = { 'data': {'type': action} } 
-            self.s.headers.update( { 'Content-Type': 'application/vnd.api+json' } )
-            action = self._http_with_retry(POST, '{}/{}/actions'.format(URL_GET_MOWERS, mower_id), json, mower_name=mower_name)
+                json = _ACTION_PAYLOADS[action]
+            action = self._http_with_retry(POST, mower.url_actions, json, mower_name=mower_name)
             if action:
+                self._invalidate_mowers_info()
                 return True
         return False
 
-    def _find_id_from_name(self, name):
-        for mower in self.mowers:
-            if name == mower['name']:
-                return mower['id']
-        return None
+    def _invalidate_mowers_info(self):
+        self.mowers_info_deadline = 0.0
 
     def _http_with_retry(self, mode, url, json_post_data=None, post_data=None, mower_name=None):
+        result, self.error = self._http_request(mode, url, json_post_data, post_data, mower_name)
+        return result
+
+    def _http_request(self, mode, url, json_post_data=None, post_data=None, mower_name=None, headers=None):
         def _analyze_http_error(message, url, mower_name=None):
-    
-            #API limits reached
-            self.api_limit_reached = True if message.status_code == 429 else False
-        
-            error_info = message.json()
+            #Error body is only parsed here, when the error description is really needed
+            try:
+                error_info = json_loads(message.content)
+            except ValueError:
+                error_info = {}
             if 'errors' in error_info:
                 return '({} - {}) {}: {} (url: {})'.format(mower_name, message.status_code, error_info['errors'][0]['title'], error_info['errors'][0]['detail'], url)
             elif 'message' in error_info:
                 return '({} - {}) {} (url: {})'.format(mower_name, message.status_code, error_info['message'], url)
             else:
                 return '({} - {}) Uncaptured error returned by Husqvarna API (url: {})'.format(mower_name, message.status_code, url)
-    
+
+        def _get_retry_after(message):
+            #Delay requested by the API (None if not given)
+            value = message.headers.get('Retry-After', message.headers.get('X-RateLimit-Reset'))
+            if value is None:
+                return None
+            try:
+                delay = float(value)
+            except ValueError:
+                #Retry-After given as HTTP-date (eg 'Wed, 21 Oct 2026 07:28:00 GMT')
+                try:
+                    return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+                except (TypeError, ValueError):
+                    return None
+            if delay > time.time():
+                delay -= time.time() #Reset given as epoch time
+            return max(delay, 0)
+
+        #API limits reached: do not call the API again before it allows it
+        #(the access token comes from the authentication host, which has its own limits)
+        if url != URL_TOKEN_REQUEST and time.monotonic() < self.api_limit_deadline:
+            return None, 'API limits reached, no calls for another {:.0f} seconds (url: {}).'.format(self.api_limit_deadline - time.monotonic(), url)
 
         retry_counter = 0
-        execution_status = False
+        rate_limit_counter = 0
+        retry_after_waited = 0
+        token_renewed = False
+        result = None
+        error = None
+        last_status_code = None #status code of the last try only (None when it got no response)
         while True:
-            time.sleep(API_CALL_DELAY*(retry_counter+1)) #Avoid doing more than 1 call per second
+            if retry_counter:
+                #Back off exponentially before retrying, with jitter to avoid retrying in step with other clients
+                time.sleep(min(API_MAX_BACKOFF, API_CALL_DELAY * 2**(retry_counter-1)) * random.uniform(0.5, 1.5))
+            self.bucket.take() #Avoid doing more than 1 call per second
+            #Take the headers of the current access token on every try (it can be renewed in between)
+            if headers is not None:
+                request_headers = headers
+            elif json_post_data is not None:
+                request_headers = self.auth_json_api_headers
+            else:
+                request_headers = self.auth_headers
             try:
                 if mode == GET:
-                    r = self.s.get(url, timeout=API_TIMEOUT)
+                    r = self.s.get(url, headers=request_headers, timeout=(API_CONNECT_TIMEOUT, API_TIMEOUT))
                 else:
-                    r = self.s.post(url, json=json_post_data, data=post_data, verify=False, timeout=API_TIMEOUT)
+                    r = self.s.post(url, json=json_post_data, data=post_data, headers=request_headers, timeout=(API_CONNECT_TIMEOUT, API_TIMEOUT))
             except (requests.exceptions.Timeout, requests.exceptions.ConnectionError, requests.exceptions.RequestException):
+                last_status_code = None
                 retry_counter += 1
                 if retry_counter >= 3:
-                    self.error = 'Connection error to url {}.'.format(url)
+                    error = 'Connection error to url {}.'.format(url)
                     break
             else:
+                last_status_code = r.status_code
+                #API limits reached (status code only, no need to parse the body); only a successful call clears it again
+                retry_after = None
+                if r.status_code == 429:
+                    self.api_limit_reached = True
+                    self.bucket.penalize()
+                    retry_after = _get_retry_after(r)
+
                 #All good
                 if r.status_code in [200, 201, 202]:
-                    self.error = None
                     self.api_limit_reached = False
-                    execution_status = True
+                    try:
+                        result = json_loads(r.content)
+                    except ValueError:
+                        error = '({} - {}) Invalid JSON returned by Husqvarna API (url: {})'.format(mower_name, r.status_code, url)
                     break
 
+                #API limits reached: wait as long as requested by the API and retry
+                elif retry_after is not None and retry_after_waited + retry_after <= API_MAX_RETRY_AFTER and rate_limit_counter < 2:
+                    rate_limit_counter += 1
+                    retry_after_waited += retry_after
+                    log('API limits reached, retry in {} seconds (url: {}).'.format(retry_after, url))
+                    time.sleep(retry_after)
+
+                #API limits reached for a longer time (eg monthly limit): suspend all calls until then
+                elif r.status_code == 429:
+                    self.api_limit_deadline = time.monotonic() + (retry_after if retry_after is not None else API_LIMIT_DEFAULT_WAIT)
+                    error = _analyze_http_error(r, url, mower_name)
+                    break
+
+                #Access token refused (401, a 403 is mostly a timeout, see below): get a new access token once and retry immediately with it
+                elif r.status_code == 401 and url != URL_TOKEN_REQUEST and not token_renewed:
+                    token_renewed = True
+                    log('Access token refused (url: {}), create new access token!!!'.format(url))
+                    if not self._request_access_token()[0]:
+                        error = _analyze_http_error(r, url, mower_name)
+                        break
+
                 #Authentication error received: following the exchange with the helpdesk openapi.servicedesk@husqvarnagroup.com, there
                 #are regularly timeouts on the commands that translates also in an authentication error. Hence adding also retries...
                 elif r.status_code == 403:
                     retry_counter += 1
                     if retry_counter >= 3:
-                        self.error = _analyze_http_error(r, url, mower_name)
+                        error = _analyze_http_error(r, url, mower_name)
                         break
             
                 #Error received
                 elif r.status_code >= 400 and r.status_code < 500:
-                    self.error = _analyze_http_error(r, url, mower_name)
+                    error = _analyze_http_error(r, url, mower_name)
                     break
 
                 #Internal server error
                 elif r.status_code >= 500:
                     retry_counter += 1
                     if retry_counter >= 3:
-                        self.error = _analyze_http_error(r, url, mower_name)
+                        error = _analyze_http_error(r, url, mower_name)
                         break
                     
                 #Other errors
                 else:
-                    self.error = 'HTTP error ({}) not specifically handled.'.format(r.status_code)
+                    error = 'HTTP error ({}) not specifically handled.'.format(r.status_code)
                     break
 
-        return r.json() if execution_status else None
+        #Access token still refused on the last try: do not use it (nor its copy on disk) anymore
+        if last_status_code == 401 and url != URL_TOKEN_REQUEST:
+            self._invalidate_access_token()
+
+        return result, error
                 
 if __name__ == "__main__":
 
@@ -437,16 +724,19 @@ if __name__ == "__main__":
     if husq:
         if husq.get_mowers() and husq.get_mowers_info():
             print(husq.mowers)
-            print('Execute ParkUntilFurtherNotice: {} - {}'.format(husq.action_ParkUntilFurtherNotice(husq.mowers[0]['name']), husq.get_http_error()))
+            print('Execute ParkUntilFurtherNotice: {} - {}'.format(husq.action_ParkUntilFurtherNotice(husq.mowers[0].name), husq.get_http_error()))
         else:
             print('Error getting mower information: {}'.format(husq.get_http_error()))
-        while True:
-            print('are_all_mowers_off: {}'.format(husq.are_all_mowers_off()))
-            if husq.get_mowers_info():
-                print('({}) {}'.format(datetime.now(), husq.mowers))
-            else:
-                print('({}) Error getting mower information: {}'.format(datetime.now(), husq.get_http_error()))
-            import time
-            time.sleep(30)
+        #Same object (and session) for every poll, so the connection to the API is kept alive between polls
+        try:
+            while True:
+                print('are_all_mowers_off: {}'.format(husq.are_all_mowers_off()))
+                if husq.get_mowers_info():
+                    print('({}) {}'.format(datetime.now(), husq.mowers))
+                else:
+                    print('({}) Error getting mower information: {}'.format(datetime.now(), husq.get_http_error()))
+                time.sleep(30)
+        finally:
+            husq.close()
     else:
         print(husq.error)
@@ -49,18 +49,23 @@ def GetNextFreeUnit(Devices):
     
 #GET DEVICE UNIT BY NAME
 def FindUnitFromName(Devices, Parameters, Name, TruncSubName=False):
+    FullName = '{} - {}'.format(Parameters['Name'], Name)
     if TruncSubName:
-        for unit in [Unit for Unit in Devices if Devices[Unit].Name.startswith('{} - {}'.format(Parameters['Name'], Name))]:
-            return unit
+        for unit in Devices:
+            if Devices[unit].Name.startswith(FullName):
+                return unit
     else:
-        for unit in [Unit for Unit in Devices if Devices[Unit].Name == '{} - {}'.format(Parameters['Name'], Name)]:
-            return unit
+        for unit in Devices:
+            if Devices[unit].Name == FullName:
+                return unit
     return False
 
 #GET DEVICE UNIT BY USING THE DESCRIPTION FIELD
 def FindUnitFromDescription(Devices, Parameters, Name):
-    for unit in [Unit for Unit in Devices if GetTagFromDescription(Devices, Unit, 'Name') == '{} - {}'.format(Parameters['Name'], Name)]:
-        return unit
+    FullName = '{} - {}'.format(Parameters['Name'], Name)
+    for unit in Devices:
+        if GetTagFromDescription(Devices, unit, 'Name') == FullName:
+            return unit
     return False
 
 #ADD TAG TO DESCRIPTION OF A DEVICE
@@ -16,7 +16,9 @@
         Consult https://developer.husqvarnagroup.cloud/applications for more information<br/>
         and to create the credientials for using the API. This gives you a client_id (or application_id)<br/>
         and a client_secret (or an application_secret). Enter both in the settings below...<br/><br/>
-        Note that polling interval is reduced to once per hour when the mower is OFF (eg in winter).<br/><br/>
+        Note that polling interval is reduced to once per hour when the mower is OFF (eg in winter).<br/>
+        While the mowers do not change (eg charging), the polling interval doubles on each update, up to 30 minutes.<br/>
+        Any change of a mower or a command from Domoticz restores the normal interval.<br/><br/>
     </description>
     <params>
         <param field="Mode1" label="Client_id" width="250px" required="true" default=""/>
@@ -43,8 +45,7 @@ from datetime import datetime, timedelta
 import Domoticz
 import Husqvarna
 import threading
-import queue
-import time
+from collections import deque
 import re
 
 #DEVICES
@@ -58,6 +59,16 @@ STATUS_SPEED_NORMAL = 0
 STATUS_SPEED_NIGHT = 1
 STATUS_SPEED_LIMITS_EXCEEDED = 2
 STATUS_SPEED_ALL_OFF = 3
+RUN_AGAIN_LIMITS_EXCEEDED = 60*MINUTE
+RUN_AGAIN_ALL_OFF = 60*MINUTE
+RUN_AGAIN_NIGHT = 180*MINUTE
+RUN_AGAIN_AFTER_ACTION = 2*MINUTE
+RUN_AGAIN_UNCHANGED_MAX = 30*MINUTE
+UNCHANGED_MAX_DOUBLINGS = 5
+NIGHT_HOURS = frozenset([22, 23, 0, 1, 2, 3, 4, 5])
+
+#ACTIVITIES OF A MOWER THAT IS BUSY MOWING
+MOWING_ACTIVITIES = frozenset(['LEAVING', 'MOWING'])
 
 #DEFAULT IMAGE
 _IMAGE = 'Husqvarna'
@@ -74,18 +85,61 @@ RESUME_SCHEDULE = 'Resume Schedule'
 PARK_UNTIL_FURTHER_NOTICE = 'Park Until Further Notice'
 PARK_UNTIL_NEXT_SCHEDULE = 'Park Until Next Schedule'
 
+#ACTIONS THAT ARE ONLY QUEUED ONCE (A PENDING ONE GIVES THE SAME RESULT, OTHERS ARE QUEUED ONCE PER MOWER)
+COALESCED_ACTIONS = frozenset([LOGIN, GET_MOWERS, GET_STATUS])
+
+#SELECTOR LEVELS OF THE ACTIONS DEVICE (action, refuse when charging)
+LEVEL_ACTIONS = {
+    10: (START, True),
+    20: (PAUSE, False),
+    30: (RESUME_SCHEDULE, False),
+    40: (PARK_UNTIL_FURTHER_NOTICE, False),
+    50: (PARK_UNTIL_NEXT_SCHEDULE, False),
+}
+
+#API CALL PER MOWER ACTION (description, call)
+MOWER_ACTIONS = {
+    START: ('Start', lambda husqvarna, mower_name: husqvarna.action_Start(mower_name, 600)),    #start for 10 hours
+    PAUSE: ('Pause', Husqvarna.Husqvarna.action_Pause),
+    RESUME_SCHEDULE: ('ResumeSchedule', Husqvarna.Husqvarna.action_ResumeSchedule),
+    PARK_UNTIL_FURTHER_NOTICE: ('ParkUntilFurtherNotice', Husqvarna.Husqvarna.action_ParkUntilFurtherNotice),
+    PARK_UNTIL_NEXT_SCHEDULE: ('ParkUntilNextSchedule', Husqvarna.Husqvarna.action_ParkUntilNextSchedule),
+}
+
+#DEVICE DEFINITIONS (CREATED FOR EACH MOWER)
+DEVICE_DEFINITIONS = {
+    STATE: {'TypeName': 'Text', 'Used': 1},
+    RUN: {'Type': 244, 'Subtype': 73, 'Switchtype': 0, 'Used': 1},
+    BATTERY: {'TypeName': 'Custom', 'Options': {'Custom': '0;%'}, 'Used': 0},
+    ACTIONS: {'TypeName': 'Selector Switch', 'Options': {'LevelActions': '|'*len(LEVEL_ACTIONS), 'LevelNames': '|'.join(['']+[LEVEL_ACTIONS[level][0] for level in sorted(LEVEL_ACTIONS)]), 'LevelOffHidden': 'false', 'SelectorStyle': '1'}, 'Used': 1},
+}
+
 ################################################################################
 # Start Plugin
 ################################################################################
 
 class BasePlugin:
 
+    __slots__ = ('debug', 'runAgain', 'runAgainNormal', 'speed_status', 'allMowersOff', 'lastMowersStatus', 'unchangedStatusCount',
+                 'imageId', 'imageInverseId', 'imageOffId', 'mowerUnits', 'commandDevicePattern', 'MyHusqvarna',
+                 'tasksQueue', 'tasksEvent', 'tasksPending', 'tasksLock', 'tasksThread')
+
     def __init__(self):
         self.debug = DEBUG_OFF
         self.runAgain = MINUTE
+        self.runAgainNormal = MINUTE
         self.speed_status = STATUS_SPEED_NORMAL
+        self.allMowersOff = False
+        self.lastMowersStatus = None
+        self.unchangedStatusCount = 0
+        self.imageId = self.imageInverseId = self.imageOffId = 0
+        self.mowerUnits = {}
+        self.commandDevicePattern = None
         self.MyHusqvarna = None
-        self.tasksQueue = queue.Queue()
+        self.tasksQueue = deque()
+        self.tasksEvent = threading.Event()
+        self.tasksPending = {}
+        self.tasksLock = threading.Lock()
         self.tasksThread = threading.Thread(name='QueueThread', target=BasePlugin.handleTasks, args=(self,))
 
     def onStart(self):
@@ -94,9 +148,21 @@ class BasePlugin:
         # Debugging On/Off
         self.debug = DEBUG_ON_NO_FRAMEWORK if Parameters['Mode6'] == 'Debug' else DEBUG_OFF
         Domoticz.Debugging(self.debug)
-        if self.debug == DEBUG_ON:
-            DumpConfigToLog(Parameters, Devices)
+        Husqvarna.DEBUG = self.debug != DEBUG_OFF
+        if Husqvarna.DEBUG:
+            #Never show the client secret (Mode2) in the log (logs are often posted on the forum)
+            DumpConfigToLog(dict(Parameters, Mode2='********') if Parameters['Mode2'] else Parameters, Devices)
+
+        # Normal update speed (parsed once, the settings cannot change without a restart of the plugin)
+        try:
+            self.runAgainNormal = MINUTE*float(Parameters['Mode5'].replace(',','.'))
+        except ValueError:
+            Domoticz.Error('Invalid number of minutes between update ({}), using 1 minute.'.format(Parameters['Mode5']))
+            self.runAgainNormal = MINUTE
         
+        # Devices accepting commands: '<plugin name> - <mower name> - Run' or '... - Actions'
+        self.commandDevicePattern = re.compile('{} - (.*?) - ({}|{})$'.format(re.escape(Parameters['Name']), re.escape(RUN), re.escape(ACTIONS)))
+
         # Check if images are in database
         if _IMAGE not in Images:
             Domoticz.Image('Husqvarna.zip').Create()
@@ -104,32 +170,27 @@ class BasePlugin:
             Domoticz.Image('Husqvarna_Inverse.zip').Create()
         if _IMAGE_OFF not in Images:
             Domoticz.Image('Husqvarna_Off.zip').Create()
+        self.imageId = Images[_IMAGE].ID
+        self.imageInverseId = Images[_IMAGE_INVERSE].ID
+        self.imageOffId = Images[_IMAGE_OFF].ID
 
         # Timeout all devices
         TimeoutDevice(Devices, All=True)
         
         # Start thread
         self.tasksThread.start()
-        self.tasksQueue.put({'Action': LOGIN})
-        self.tasksQueue.put({'Action': GET_MOWERS})
-        self.tasksQueue.put({'Action': GET_STATUS})
+        self.putTask({'Action': LOGIN})
 
     def onStop(self):
         Domoticz.Debug('onStop called')
         
         # Signal queue thread to exit
-        self.tasksQueue.put(None)
-        if self.tasksThread and self.tasksThread.is_alive():
-            self.tasksThread.join()
-
-        # Wait until queue thread has exited
-        Domoticz.Debug('Threads still active: {} (should be 1)'.format(threading.active_count()))
-        endTime = time.time() + 70
-        while (threading.active_count() > 1) and (time.time() < endTime):
-            for thread in threading.enumerate():
-                if thread.name != threading.current_thread().name:
-                    Domoticz.Debug('Thread {} is still running, waiting otherwise Domoticz will abort on plugin exit.'.format(thread.name))
-            time.sleep(1.0)
+        self.putTask(None)
+        # Wait until queue thread has exited, otherwise Domoticz will abort on plugin exit
+        if self.tasksThread.is_alive():
+            self.tasksThread.join(timeout=70)
+            if self.tasksThread.is_alive():
+                Domoticz.Error('Thread {} is still running after 70 seconds.'.format(self.tasksThread.name))
 
         Domoticz.Debug('Plugin stopped')
 
@@ -141,45 +202,31 @@ class BasePlugin:
 
     def onCommand(self, Unit, Command, Level, Hue):
         Domoticz.Debug('onCommand called for Unit: {} ({}) - Parameter: {} - Level: {}'.format(Unit, Devices[Unit].Name, Command, Level))
-        if Devices[Unit].Name.endswith(RUN) or Devices[Unit].Name.endswith(ACTIONS):
+        match = self.commandDevicePattern.search(Devices[Unit].Name)
+        if match:
             try:
-                mower_name = ''
-                if Devices[Unit].Name.endswith(RUN):
-                    mower_name = re.search('{} - (.*?) - {}'.format(Parameters['Name'], RUN), Devices[Unit].Name)[1]
-                elif Devices[Unit].Name.endswith(ACTIONS):
-                    mower_name = re.search('{} - (.*?) - {}'.format(Parameters['Name'], ACTIONS), Devices[Unit].Name)[1]
+                mower_name, device = match.group(1, 2)
                 Domoticz.Debug('Mower found to send command to ({}).'.format(mower_name))
-                found = False
-                for mower in self.MyHusqvarna.mowers:
-                    if mower['name'] == mower_name:
-                        found = True
-                        if Devices[Unit].Name.endswith(RUN):
-                            if Command == 'On':
-                                if mower['activity'] == 'CHARGING':
-                                    Domoticz.Status('Mower {} cannot be started as it is still charging.'.format(mower['name']))
-                                else:
-                                    UpdateDevice(False, Devices, Unit, 1, 1)
-                                    self.tasksQueue.put({'Action': START, 'Mower_name': mower_name})
-                            else:
-                                UpdateDevice(False, Devices, Unit, 0, 0)
-                                self.tasksQueue.put({'Action': PARK_UNTIL_FURTHER_NOTICE, 'Mower_name': mower_name})
-                        elif Devices[Unit].Name.endswith(ACTIONS) and Command == 'Set Level' and Level:
-                            if Level == 10:
-                                if mower['activity'] == 'CHARGING':
-                                    Domoticz.Status('Mower {} cannot be started as it is still charging.'.format(mower['name']))
-                                else:
-                                    self.tasksQueue.put({'Action': START, 'Mower_name': mower_name})
-                            elif Level == 20:
-                                self.tasksQueue.put({'Action': PAUSE, 'Mower_name': mower_name})
-                            elif Level == 30:
-                                self.tasksQueue.put({'Action': RESUME_SCHEDULE, 'Mower_name': mower_name})
-                            elif Level == 40:
-                                self.tasksQueue.put({'Action': PARK_UNTIL_FURTHER_NOTICE, 'Mower_name': mower_name})
-                            elif Level == 50:
-                                self.tasksQueue.put({'Action': PARK_UNTIL_NEXT_SCHEDULE, 'Mower_name': mower_name})
-                if not found:
+                mower = self.MyHusqvarna.mowers_by_name.get(mower_name)
+                if mower is None:
                     Domoticz.Error('"{}" is not a valid mower (cannot be found in the list of connected mowers "{}").'.format(mower_name, self.MyHusqvarna.mowers)) 
                     TimeoutDevicesByName(Devices, mower_name)               
+                elif device == RUN:
+                    if Command == 'On':
+                        if mower.activity == 'CHARGING':
+                            Domoticz.Status('Mower {} cannot be started as it is still charging.'.format(mower.name))
+                        else:
+                            UpdateDevice(False, Devices, Unit, 1, 1)
+                            self.putTask({'Action': START, 'Mower_name': mower_name})
+                    else:
+                        UpdateDevice(False, Devices, Unit, 0, 0)
+                        self.putTask({'Action': PARK_UNTIL_FURTHER_NOTICE, 'Mower_name': mower_name})
+                elif Command == 'Set Level' and Level in LEVEL_ACTIONS:
+                    action, check_charging = LEVEL_ACTIONS[Level]
+                    if check_charging and mower.activity == 'CHARGING':
+                        Domoticz.Status('Mower {} cannot be started as it is still charging.'.format(mower.name))
+                    else:
+                        self.putTask({'Action': action, 'Mower_name': mower_name})
             except:
                 Domoticz.Debug('Error executing the action.')
                 
@@ -196,60 +243,103 @@ class BasePlugin:
         if self.runAgain <= 0:
         
             if self.MyHusqvarna is None:
-                self.tasksQueue.put({'Action': LOGIN})
+                #Not logged in yet, the login queues the mower list and status itself
+                self.putTask({'Action': LOGIN})
+                self.runAgain = self.runAgainNormal
+                return
             
             now = datetime.now()
             if self.MyHusqvarna.get_timestamp_last_update_mower_list() + timedelta(days=1) < now:
-                self.tasksQueue.put({'Action': GET_MOWERS})
+                self.putTask({'Action': GET_MOWERS})
                 
-            self.tasksQueue.put({'Action': GET_STATUS})
+            self.putTask({'Action': GET_STATUS})
             # Dynamic adaption of update time to reduce possibility throttling on reaching the API limits
             # This does not solve the problem of having reached the limit of 10000 requests/month (max: every 4-5 minutes)
             if self.MyHusqvarna.are_api_limits_reached():
-                self.runAgain = max(60*MINUTE, self.runAgain)
+                self.runAgain = max(RUN_AGAIN_LIMITS_EXCEEDED, self.runAgain)
                 if self.speed_status != STATUS_SPEED_LIMITS_EXCEEDED:
                     Domoticz.Status('Reduce status update speed to {} minutes as Husqvarna API limits are reached'.format(self.runAgain/MINUTE))
                     self.speed_status = STATUS_SPEED_LIMITS_EXCEEDED
             else:
-                hours = now.hour
-                if self.MyHusqvarna.are_all_mowers_off():
-                    self.runAgain = 60*MINUTE    #slow down when mowers are off
+                if self.allMowersOff:
+                    self.runAgain = RUN_AGAIN_ALL_OFF    #slow down when mowers are off
                     if self.speed_status != STATUS_SPEED_ALL_OFF:
                         Domoticz.Status('Reduce status update speed to {} minutes as all Husqvarna mowers are off.'.format(self.runAgain/MINUTE))
                         self.speed_status = STATUS_SPEED_ALL_OFF
-                elif hours >= 22 and hours <= 5:
-                    self.runAgain = MINUTE*180   #limited status update during night
-                    if self.speed_status != STATUS_SPEED_LIMITS_NIGHT:
+                elif now.hour in NIGHT_HOURS:
+                    self.runAgain = RUN_AGAIN_NIGHT   #limited status update during night
+                    if self.speed_status != STATUS_SPEED_NIGHT:
                         Domoticz.Status('Reduce status update speed to {} minutes as all we are running into the night.'.format(self.runAgain/MINUTE))
-                        self.speed_status = STATUS_SPEED_LIMITS_NIGHT
+                        self.speed_status = STATUS_SPEED_NIGHT
                 else:                        
-                    self.runAgain = MINUTE*float(Parameters['Mode5'].replace(',','.'))
+                    #Double the interval for each poll without any change of the mowers (up to a limit)
+                    self.runAgain = max(self.runAgainNormal, min(self.runAgainNormal * 2**min(self.unchangedStatusCount, UNCHANGED_MAX_DOUBLINGS), RUN_AGAIN_UNCHANGED_MAX))
                     if self.speed_status != STATUS_SPEED_NORMAL:
                         Domoticz.Status('Re-establish normal update speed to {} minutes.'.format(self.runAgain/MINUTE))
                         self.speed_status = STATUS_SPEED_NORMAL
 
+    # Find the unit of a device of a mower (create the device if it does not exist yet, remember it for the next updates)
+    def getMowerUnit(self, mower_name, device):
+        Unit = self.mowerUnits.get((mower_name, device))
+        if Unit in Devices:
+            return Unit
+        Name = '{} - {}'.format(mower_name, device)
+        Unit = FindUnitFromName(Devices, Parameters, Name)
+        if not Unit:
+            Unit = GetNextFreeUnit(Devices)
+            Domoticz.Device(Unit=Unit, Name=Name, Image=self.imageId, **DEVICE_DEFINITIONS[device]).Create()
+        self.mowerUnits[(mower_name, device)] = Unit
+        return Unit
+
+    # Hand over a task to the queue thread (single consumer, so a deque is sufficient)
+    def putTask(self, task):
+        with self.tasksLock:
+            if task is not None:
+                key = GetTaskKey(task)
+                queued = self.tasksPending.get(key)
+                if queued is not None:
+                    #Still waiting in the queue: the newer action for the same mower is sent instead
+                    Domoticz.Debug('Task {} replaces queued task {}.'.format(task['Action'], queued['Action']))
+                    queued.update(task)
+                    return
+                self.tasksPending[key] = task
+            self.tasksQueue.append(task)
+        self.tasksEvent.set()
+
     # Thread to handle the messages
     def handleTasks(self):
-        try:
-            Domoticz.Debug('Entering tasks handler')
-            while True:
-                task = self.tasksQueue.get(block=True)
-                if task is None:
-                    Domoticz.Debug('Exiting task handler')
-                    try:
-                        self.MyHusqvarna.close()
-                        self.MyHusqvarna = None
-                    except AttributeError:
-                        pass
-                    self.tasksQueue.task_done()
-                    break
+        Domoticz.Debug('Entering tasks handler')
+        while True:
+            if not self.tasksQueue:
+                self.tasksEvent.wait()
+                self.tasksEvent.clear()
+                continue
+            with self.tasksLock:
+                task = self.tasksQueue.popleft()
+                if task is not None:
+                    del self.tasksPending[GetTaskKey(task)]
+            if task is None:
+                Domoticz.Debug('Exiting task handler')
+                try:
+                    self.MyHusqvarna.close()
+                    self.MyHusqvarna = None
+                except AttributeError:
+                    pass
+                break
 
+            try:
                 Domoticz.Debug('Handling task: {}.'.format(task['Action']))
                 if task['Action'] == LOGIN:
-                    self.MyHusqvarna = Husqvarna.Husqvarna(Parameters['Mode1'], Parameters['Mode2'])
+                    #Keep an existing client (its session, token and renewal timer), it renews the token itself when needed
+                    if self.MyHusqvarna is None:
+                        self.MyHusqvarna = Husqvarna.Husqvarna(Parameters['Mode1'], Parameters['Mode2'], token_file='{}Husqvarna_token.json'.format(Parameters['HomeFolder']))
                     if not self.MyHusqvarna:
                         Domoticz.Error('Unable to get credentials from Husqvarna Cloud (Husqvarna description: {}).'.format(self.MyHusqvarna.get_http_error()))
                         TimeoutDevice(Devices, All=True)
+                    else:
+                        #Only continue with the mowers once logged in
+                        self.putTask({'Action': GET_MOWERS})
+                        self.putTask({'Action': GET_STATUS})
                 
                 elif task['Action'] == GET_MOWERS:
                     if not self.MyHusqvarna.get_mowers():
@@ -258,61 +348,42 @@ class BasePlugin:
 
                 elif task['Action'] == GET_STATUS:
                     if self.MyHusqvarna.get_mowers_info():
-                        if self.MyHusqvarna.mowers:
+                        self.allMowersOff = self.MyHusqvarna.are_all_mowers_off()
+                        mowers = self.MyHusqvarna.mowers
+                        mowersStatus = tuple((mower.name, mower.state, mower.activity, mower.error_state) for mower in mowers)
+                        if mowersStatus == self.lastMowersStatus:
+                            self.unchangedStatusCount += 1
+                        else:
+                            self.unchangedStatusCount = 0
+                            #onHeartbeat already planned the next update with the slowed down interval: poll again at normal speed
+                            if self.speed_status == STATUS_SPEED_NORMAL:
+                                self.runAgain = min(self.runAgain, self.runAgainNormal)
+                        self.lastMowersStatus = mowersStatus
+                        if mowers:
                            
-                            for mower in self.MyHusqvarna.mowers:
+                            for mower in mowers:
                             
                                 # Status of Mower
-                                Unit = FindUnitFromName(Devices, Parameters, '{} - {}'.format(mower['name'], STATE))
-                                if not Unit:
-                                    Unit = GetNextFreeUnit(Devices)
-                                    Domoticz.Device(Unit=Unit, Name='{} - {}'.format(mower['name'], STATE), TypeName='Text', Image=Images[_IMAGE].ID, Used=1).Create()
-                                    TimeoutDevice(Devices, Unit=Unit)
-                                if mower['error_state']:
-                                    Error = mower['error_state'].replace('\r', '').replace('\n', '')
-                                    Text = '{}: {}\n(<body><p style="line-height:80%;font-size:80%;">{}</p></body>)'.format(mower['state'], mower['activity'], Error)
-                                else:
-                                    Text = '{}'.format(mower['state']) if mower['activity'] == 'NOT_APPLICABLE' else '{}: {}'.format(mower['state'], mower['activity'])
-                                if mower['state'] == 'OFF':
-                                    Image = Images[_IMAGE_OFF].ID
+                                if mower.error_state:
+                                    Error = mower.error_state.replace('\r', '').replace('\n', '')
+                                    Text = '{}: {}\n(<body><p style="line-height:80%;font-size:80%;">{}</p></body>)'.format(mower.state, mower.activity, Error)
                                 else:
-                                    Image = Images[_IMAGE].ID if mower['activity'] in ['LEAVING', 'MOWING'] else Images[_IMAGE_INVERSE].ID
-                                UpdateDevice(False, Devices, Unit, 0, Text, Image=Image)
-
-                                # Busy mowing or not
-                                Unit = FindUnitFromName(Devices, Parameters, '{} - {}'.format(mower['name'], RUN))
-                                if not Unit:
-                                    Unit = GetNextFreeUnit(Devices)
-                                    Domoticz.Device(Unit=Unit, Name='{} - {}'.format(mower['name'], RUN), Type=244, Subtype=73, Switchtype=0, Image=Images[_IMAGE].ID, Used=1).Create()
-                                    TimeoutDevice(Devices, Unit=Unit)
-                                Image = Images[_IMAGE_OFF].ID if mower['state'] == 'OFF' else Images[_IMAGE].ID
-                                if mower['activity'] in ['LEAVING', 'MOWING']:
-                                    UpdateDevice(False, Devices, Unit, 1, 1, Image=Image)
+                                    Text = '{}'.format(mower.state) if mower.activity == 'NOT_APPLICABLE' else '{}: {}'.format(mower.state, mower.activity)
+                                running = 1 if mower.activity in MOWING_ACTIVITIES else 0
+                                if mower.state == 'OFF':
+                                    Image = ImageRun = self.imageOffId
                                 else:
-                                    UpdateDevice(False, Devices, Unit, 0, 0, Image=Image)
-                                UpdateDeviceBatSig(False, Devices, Unit, BatteryLevel=mower['battery_pct'])
-
-                                # Battery level
-                                Unit = FindUnitFromName(Devices, Parameters, '{} - {}'.format(mower['name'], BATTERY))
-                                if not Unit:
-                                    Unit = GetNextFreeUnit(Devices)
-                                    Domoticz.Device(Unit=Unit, Name='{} - {}'.format(mower['name'], BATTERY), TypeName='Custom', Options={'Custom': '0;%'}, Image=Images[_IMAGE].ID, Used=0).Create()
-                                if mower['state'] == 'OFF':
-                                    Image = Images[_IMAGE_OFF].ID
-                                else:
-                                    Image = Images[_IMAGE].ID if mower['activity'] in ['LEAVING', 'MOWING'] else Images[_IMAGE_INVERSE].ID
-                                UpdateDevice(False, Devices, Unit, mower['battery_pct'], mower['battery_pct'], Image=Image)
-
-                                # Actions
-                                Unit = FindUnitFromName(Devices, Parameters, '{} - {}'.format(mower['name'], ACTIONS))
-                                if not Unit:
-                                    Unit = GetNextFreeUnit(Devices)
-                                    Domoticz.Device(Unit=Unit, Name='{} - {}'.format(mower['name'], ACTIONS), TypeName='Selector Switch', Options={'LevelActions': '|||||', 'LevelNames': '|{}|{}|{}|{}|{}'.format(START, PAUSE, RESUME_SCHEDULE, PARK_UNTIL_FURTHER_NOTICE, PARK_UNTIL_NEXT_SCHEDULE), 'LevelOffHidden': 'false', 'SelectorStyle': '1'}, Image=Images[_IMAGE].ID, Used=1).Create()
-                                if mower['state'] == 'OFF':
-                                    Image = Images[_IMAGE_OFF].ID
-                                else:
-                                    Image = Images[_IMAGE].ID if mower['activity'] in ['LEAVING', 'MOWING'] else Images[_IMAGE_INVERSE].ID
-                                UpdateDevice(True, Devices, Unit, 2, 0, Image=Image)
+                                    Image = self.imageId if running else self.imageInverseId
+                                    ImageRun = self.imageId
+
+                                # State, busy mowing or not, battery level and actions
+                                for device, nValue, sValue, kwargs in (
+                                        (STATE, 0, Text, {'Image': Image}),
+                                        (RUN, running, running, {'Image': ImageRun, 'BatteryLevel': mower.battery_pct}),
+                                        (BATTERY, mower.battery_pct, mower.battery_pct, {'Image': Image}),
+                                        (ACTIONS, 2, 0, {'Image': Image})):
+                                    Unit = self.getMowerUnit(mower.name, device)
+                                    UpdateDevice(False, Devices, Unit, nValue, sValue, **kwargs)
 
                         else:
                             Domoticz.Error('No Husvarna mowers available in the list.')
@@ -322,89 +393,46 @@ class BasePlugin:
                         Domoticz.Error('Error getting detailed status of mowers from Husqvarna Cloud (Husqvarna description: {}).'.format(self.MyHusqvarna.get_http_error()))
                         TimeoutDevice(Devices, All=True)
 
-                elif task['Action'] == START:
-                    #Start for 10 hours
-                    if self.MyHusqvarna.is_mower_off(task['Mower_name']) == False and not self.MyHusqvarna.action_Start(task['Mower_name'], 600):
-                        Domoticz.Error('Error Husqvarna {} on Start Action: {}'.format(task['Mower_name'], self.MyHusqvarna.get_http_error()))
-                        TimeoutDevicesByName(Devices, task['Mower_name'])
-                    self.runAgain = 2*MINUTE
-
-                elif task['Action'] == PARK_UNTIL_FURTHER_NOTICE:
-                    if self.MyHusqvarna.is_mower_off(task['Mower_name']) == False and not self.MyHusqvarna.action_ParkUntilFurtherNotice(task['Mower_name']):
-                        Domoticz.Error('Error Husqvarna {} on ParkUntilFurtherNotice action: {}'.format(task['Mower_name'], self.MyHusqvarna.get_http_error()))
-                        TimeoutDevicesByName(Devices, task['Mower_name'])
-                    self.runAgain = 2*MINUTE
-
-                elif task['Action'] == PARK_UNTIL_NEXT_SCHEDULE:
-                    if self.MyHusqvarna.is_mower_off(task['Mower_name']) == False and not self.MyHusqvarna.action_ParkUntilNextSchedule(task['Mower_name']):
-                        Domoticz.Error('Error Husqvarna {} on ParkUntilNextSchedule action: {}'.format(task['Mower_name'], self.MyHusqvarna.get_http_error()))
-                        TimeoutDevicesByName(Devices, task['Mower_name'])
-                    self.runAgain = 2*MINUTE
-                    
-                elif task['Action'] == PAUSE:
-                    if self.MyHusqvarna.is_mower_off(task['Mower_name']) == False and not self.MyHusqvarna.action_Pause(task['Mower_name']):
-                        Domoticz.Error('Error Husqvarna {} on Pause action: {}'.format(task['Mower_name'], self.MyHusqvarna.get_http_error()))
-                        TimeoutDevicesByName(Devices, task['Mower_name'])
-                    self.runAgain = 2*MINUTE
-
-                elif task['Action'] == RESUME_SCHEDULE:
-                    if self.MyHusqvarna.is_mower_off(task['Mower_name']) == False and not self.MyHusqvarna.action_ResumeSchedule(task['Mower_name']):
-                        Domoticz.Error('Error Husqvarna {} on ResumeSchedule action: {}'.format(task['Mower_name'], self.MyHusqvarna.get_http_error()))
+                elif task['Action'] in MOWER_ACTIONS:
+                    description, action = MOWER_ACTIONS[task['Action']]
+                    if self.MyHusqvarna.is_mower_off(task['Mower_name']) == False and not action(self.MyHusqvarna, task['Mower_name']):
+                        Domoticz.Error('Error Husqvarna {} on {} action: {}'.format(task['Mower_name'], description, self.MyHusqvarna.get_http_error()))
                         TimeoutDevicesByName(Devices, task['Mower_name'])
-                    self.runAgain = 2*MINUTE
+                    self.runAgain = RUN_AGAIN_AFTER_ACTION
+                    self.unchangedStatusCount = 0
 
                 else:
                     Domoticz.Error('TaskHandler: unknown action code {}'.format(task['Action']))
 
                 Domoticz.Debug('Finished handling task: {}.'.format(task['Action']))
-                self.tasksQueue.task_done()
 
-        except Exception as err:
-            Domoticz.Error('General error TaskHandler: {}'.format(err))
-            # For debugging
-            import traceback
-            Domoticz.Debug('Login error TRACEBACK: {}'.format(traceback.format_exc()))
-            with open('{}Husqvarna_traceback.txt'.format(Parameters['HomeFolder']), "a") as myfile:
-                myfile.write('{}'.format(traceback.format_exc()))
-                myfile.write('---------------------------------\n')
-            self.tasksQueue.task_done()
+            except Exception as err:
+                Domoticz.Error('General error TaskHandler: {}'.format(err))
+                # For debugging
+                import traceback
+                Domoticz.Debug('Login error TRACEBACK: {}'.format(traceback.format_exc()))
+                with open('{}Husqvarna_traceback.txt'.format(Parameters['HomeFolder']), "a") as myfile:
+                    myfile.write('{}'.format(traceback.format_exc()))
+                    myfile.write('---------------------------------\n')
 
 
 global _plugin
 _plugin = BasePlugin()
 
-def onStart():
-    global _plugin
-    _plugin.onStart()
-
-def onStop():
-    global _plugin
-    _plugin.onStop()
-
-def onConnect(Connection, Status, Description):
-    global _plugin
-    _plugin.onConnect(Connection, Status, Description)
-
-def onMessage(Connection, Data):
-    global _plugin
-    _plugin.onMessage(Connection, Data)
-
-def onCommand(Unit, Command, Level, Hue):
-    global _plugin
-    _plugin.onCommand(Unit, Command, Level, Hue)
-
-def onNotification(Name, Subject, Text, Status, Priority, Sound, ImageFile):
-    global _plugin
-    _plugin.onNotification(Name, Subject, Text, Status, Priority, Sound, ImageFile)
-
-def onDisconnect(Connection):
-    global _plugin
-    _plugin.onDisconnect(Connection)
-
-def onHeartbeat():
-    global _plugin
-    _plugin.onHeartbeat()
+# Domoticz calls the module level callbacks, bind them directly to the plugin instance
+onStart = _plugin.onStart
+onStop = _plugin.onStop
+onConnect = _plugin.onConnect
+onMessage = _plugin.onMessage
+onCommand = _plugin.onCommand
+onNotification = _plugin.onNotification
+onDisconnect = _plugin.onDisconnect
+onHeartbeat = _plugin.onHeartbeat
 
 ################################################################################
 # Specific helper functions
 ################################################################################
+
+#KEY OF A QUEUED TASK (A NEWER TASK WITH THE SAME KEY REPLACES THE QUEUED ONE)
+def GetTaskKey(task):
+    return task['Action'] if task['Action'] in COALESCED_ACTIONS else ('Mower', task['Mower_name'])